@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 """nanocode - minimal claude code alternative"""
 
-import glob as globlib, json, os, platform, re, shutil, subprocess, sys, urllib.request
+import base64, codecs, collections, concurrent.futures, fnmatch, functools, glob as globlib, heapq, http.client, itertools, json, locale, os, platform, re, select, shutil, signal, stat, subprocess, sys, time, urllib.parse, urllib.request
+
+try:  # optional: Rust-backed JSON for the per-turn payload, stdlib fallback keeps zero deps
+    import orjson
+
+    json_dumps, json_loads = orjson.dumps, orjson.loads
+except ImportError:
+    json_dumps, json_loads = (lambda obj: json.dumps(obj).encode()), json.loads
 
 # API configuration
 OPENROUTER_KEY = os.environ.get("OPENROUTER_API_KEY")
@@ -12,7 +19,7 @@ ANTHROPIC_KEY = os.environ.get("ANTHROPIC_API_KEY")
 if GEMINI_KEY:
     PROVIDER = "gemini"
     MODEL = os.environ.get("MODEL", "gemini-2.0-flash-exp")
-    API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL}:generateContent"
+    API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL}:streamGenerateContent"
 elif OPENROUTER_KEY:
     PROVIDER = "openrouter"
     MODEL = os.environ.get("MODEL", "anthropic/claude-opus-4.5")
@@ -32,10 +39,55 @@ BLUE, CYAN, GREEN, YELLOW, RED = (
     "\033[31m",
 )
 
+# Output templates, built once instead of re-formatting colors per line
+OUTPUT_LINE = f"  {DIM}│ %s{RESET}"
+TEXT_BLOCK = f"\n{CYAN}⏺{RESET} %s"
+TOOL_HEADER = f"\n{GREEN}⏺ %s{RESET}({DIM}%s{RESET})"
+TOOL_PREVIEW = f"  {DIM}⎿  %s{RESET}"
+ERROR_LINE = f"{RED}⏺ Error: %s{RESET}"
+BOLD_REPL = f"{BOLD}\\1{RESET}"
+
+_MD_BOLD = re.compile(r"\*\*(.+?)\*\*")
+_NEWLINE = re.compile(r"\r\n?|\n")  # universal newlines, as text-mode files split them
+
+
+try:  # optional: RE2 matches in linear time with a DFA instead of re's backtracking VM
+    import re2
+except ImportError:
+    re2 = None
+
+
+# RE2's Perl classes are ASCII-only, unlike re's Unicode \w \d \s \b
+_PERL_CLASS = re.compile(r"\\[wWdDsSbB]")
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(pat):
+    if re2 is not None and not _PERL_CLASS.search(pat):
+        try:
+            return re2.compile(pat)
+        except re2.error:
+            pass  # backreferences/lookaround are unsupported by RE2, use re
+    return re.compile(pat)
+
+
+# grep() walk filters
+SKIP_DIRS = frozenset({".git", "node_modules", "__pycache__", ".venv", "venv", "dist", "build", "target"})
+BINARY_EXTS = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".pdf",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".tar", ".jar",
+    ".so", ".dylib", ".dll", ".exe", ".o", ".a", ".pyc", ".pyo", ".class",
+    ".woff", ".woff2", ".ttf", ".otf", ".mp3", ".mp4", ".mov", ".wav",
+})
+MAX_GREP_SIZE = 2_000_000
+
+IO_BUFSIZE = 1 << 17  # 128 KiB, well above the usual 4-8 KiB st_blksize default
+
 
 # --- System information ---
 
 
+@functools.lru_cache(maxsize=None)
 def get_system_info():
     """Gather system information to help LLM provide contextually appropriate responses."""
     info_parts = []
@@ -69,79 +121,226 @@ def get_system_info():
 
 
 def read(args):
-    lines = open(args["path"]).readlines()
     offset = args.get("offset", 0)
-    limit = args.get("limit", len(lines))
-    selected = lines[offset : offset + limit]
-    return "".join(f"{offset + idx + 1:4}| {line}" for idx, line in enumerate(selected))
+    limit = args.get("limit")
+    if offset < 0 or (limit is not None and limit < 0):
+        return "error: offset and limit must be non-negative"
+    with open(args["path"], buffering=IO_BUFSIZE) as f:
+        selected = list(itertools.islice(f, offset, None if limit is None else offset + limit))
+    return "".join([f"{n:4}| {line}" for n, line in enumerate(selected, offset + 1)])
 
 
 def write(args):
-    with open(args["path"], "w") as f:
+    with open(args["path"], "w", buffering=IO_BUFSIZE) as f:
         f.write(args["content"])
     return "ok"
 
 
 def edit(args):
-    text = open(args["path"]).read()
+    with open(args["path"], buffering=IO_BUFSIZE) as f:
+        text = f.read()
     old, new = args["old"], args["new"]
-    if old not in text:
+    first = text.find(old)
+    if first < 0:
         return "error: old_string not found"
-    count = text.count(old)
-    if not args.get("all") and count > 1:
-        return f"error: old_string appears {count} times, must be unique (use all=true)"
-    replacement = (
-        text.replace(old, new) if args.get("all") else text.replace(old, new, 1)
-    )
-    with open(args["path"], "w") as f:
+    if args.get("all"):
+        replacement = text.replace(old, new)
+    elif text.find(old, first + len(old)) >= 0:
+        return f"error: old_string appears {text.count(old)} times, must be unique (use all=true)"
+    else:
+        replacement = text[:first] + new + text[first + len(old):]
+    with open(args["path"], "w", buffering=IO_BUFSIZE) as f:
         f.write(replacement)
     return "ok"
 
 
+def _file_mtime(path):
+    """mtime for regular files, 0 for anything else, from a single stat call."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    return st.st_mtime if stat.S_ISREG(st.st_mode) else 0
+
+
+def _scan_glob(root, name_pat, recursive):
+    """Yield (mtime, path) for entries matching name_pat, reusing scandir's cached stat."""
+    show_hidden = name_pat.startswith(".")
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        hidden = entry.name.startswith(".")
+        if (show_hidden or not hidden) and fnmatch.fnmatch(entry.name, name_pat):
+            yield (entry.stat().st_mtime if entry.is_file() else 0), entry.path
+        if recursive and not hidden and entry.is_dir():
+            yield from _scan_glob(entry.path, name_pat, True)
+
+
 def glob(args):
-    pattern = (args.get("path", ".") + "/" + args["pat"]).replace("//", "/")
-    files = globlib.glob(pattern, recursive=True)
-    files = sorted(
-        files,
-        key=lambda f: os.path.getmtime(f) if os.path.isfile(f) else 0,
-        reverse=True,
-    )
+    root, pat = args.get("path", "."), args["pat"]
+    limit = max(1, int(args.get("limit", 200)))  # Gemini sends NUMBER params as floats
+    recursive = pat.startswith("**/")
+    name_pat = pat[3:] if recursive else pat
+    if "/" in name_pat or os.sep in name_pat or "**" in name_pat or globlib.has_magic(root):
+        # multi-component pattern: let glob expand it, then stat each match
+        pattern = (root + "/" + pat).replace("//", "/")
+        files = globlib.glob(pattern, recursive=True)
+        files = heapq.nlargest(limit, files, key=_file_mtime)
+    else:
+        matches = heapq.nlargest(limit, _scan_glob(root, name_pat, recursive), key=lambda m: m[0])
+        files = [path for _mtime, path in matches]
+    if len(files) == limit:
+        files.append(f"... (limit {limit} reached, narrow the pattern or raise limit)")
     return "\n".join(files) or "none"
 
 
+def _scan_grep_dir(root):
+    """Yield searchable files under a directory, checking sizes via scandir's cached stat."""
+    subdirs = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if name not in SKIP_DIRS:
+                            subdirs.append(entry.path)
+                    elif (
+                        entry.is_file()
+                        and os.path.splitext(name)[1].lower() not in BINARY_EXTS
+                        and entry.stat().st_size <= MAX_GREP_SIZE
+                    ):
+                        yield entry.path
+                except OSError:
+                    continue
+    except OSError:
+        return
+    for subdir in subdirs:
+        yield from _scan_grep_dir(subdir)
+
+
+def _grep_files(root):
+    """Yield searchable files under root, pruning vendored/hidden dirs and binaries."""
+    if os.path.isfile(root):
+        return iter([root])
+    return _scan_grep_dir(root)
+
+
+def _grep_file(filepath, search):
+    """Return up to 50 "path:line:text" hits from one file, skipping binaries."""
+    hits = []
+    try:
+        with open(filepath, "rb") as f:
+            head = f.read(4096)
+            if b"\x00" in head:  # binary file
+                return hits
+            data = head + f.read()
+    except Exception:
+        return hits
+    lines = _NEWLINE.split(data.decode("utf-8", "replace"))
+    if not lines[-1]:
+        lines.pop()
+    for line_num, line in enumerate(lines, 1):
+        if search(line):
+            hits.append(f"{filepath}:{line_num}:{line.rstrip()}")
+            if len(hits) >= 50:
+                break
+    return hits
+
+
+def _grep_batch(filepaths, search):
+    return [hit for filepath in filepaths for hit in _grep_file(filepath, search)]
+
+
 def grep(args):
-    pattern = re.compile(args["pat"])
+    search = _compile(args["pat"]).search
     hits = []
-    for filepath in globlib.glob(args.get("path", ".") + "/**", recursive=True):
-        try:
-            for line_num, line in enumerate(open(filepath), 1):
-                if pattern.search(line):
-                    hits.append(f"{filepath}:{line_num}:{line.rstrip()}")
-        except Exception:
-            pass
+    files = _grep_files(args.get("path", "."))
+    batches = iter(lambda: list(itertools.islice(files, 8)), [])
+    # overlap file reads across threads; a bounded window of batches keeps the early exit cheap
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        pending = collections.deque(pool.submit(_grep_batch, batch, search) for batch in itertools.islice(batches, 16))
+        while pending:
+            hits.extend(pending.popleft().result())
+            if len(hits) >= 50:
+                pool.shutdown(cancel_futures=True)
+                break
+            for batch in itertools.islice(batches, 1):
+                pending.append(pool.submit(_grep_batch, batch, search))
     return "\n".join(hits[:50]) or "none"
 
 
+# bash() echo batching: write at most every 64 KiB or 50 ms while output keeps arriving
+ECHO_BUFSIZE = 1 << 16
+ECHO_LATENCY = 0.05
+
+
+def _pipe_ready(fd):
+    """True if reading fd would not block; always False where select() cannot poll pipes."""
+    return os.name == "posix" and bool(select.select([fd], [], [], 0)[0])
+
+
 def bash(args):
     proc = subprocess.Popen(
         args["cmd"], shell=True,
         stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-        text=True
+        bufsize=0
     )
-    output_lines = []
+    fd = proc.stdout.fileno()
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))("replace")
+    output_chunks, partial, skip_lf = [], [], False
+    echo, echo_size, last_flush = [], 0, time.monotonic()
     try:
         while True:
-            line = proc.stdout.readline()
-            if not line and proc.poll() is not None:
+            chunk = os.read(fd, 1 << 16)
+            text = decoder.decode(chunk, final=not chunk)
+            output_chunks.append(text)
+            # universal newlines: a trailing \r ends its line now; a \n right after it is not a new line
+            if skip_lf and text.startswith("\n"):
+                text = text[1:]
+                skip_lf = False
+            if text:
+                skip_lf = text.endswith("\r")
+            pieces = _NEWLINE.split(text)
+            partial.append(pieces[0])
+            lines = []
+            if len(pieces) > 1:
+                lines = ["".join(partial), *pieces[1:-1]]
+                partial = [pieces[-1]]
+            if not chunk and any(partial):
+                lines.append("".join(partial))
+            for line in lines:
+                echo.append(OUTPUT_LINE % line.rstrip() + "\n")
+                echo_size += len(echo[-1])
+            # hold output only while more is already waiting, so quiet commands still echo promptly
+            if echo and (
+                not chunk
+                or echo_size >= ECHO_BUFSIZE
+                or time.monotonic() - last_flush >= ECHO_LATENCY
+                or not _pipe_ready(fd)
+            ):
+                sys.stdout.write("".join(echo))
+                sys.stdout.flush()
+                echo.clear()
+                echo_size, last_flush = 0, time.monotonic()
+            if not chunk:
                 break
-            if line:
-                print(f"  {DIM}│ {line.rstrip()}{RESET}", flush=True)
-                output_lines.append(line)
         proc.wait(timeout=30)
     except subprocess.TimeoutExpired:
         proc.kill()
-        output_lines.append("\n(timed out after 30s)")
-    return "".join(output_lines).strip() or "(empty)"
+        output_chunks.append("\n(timed out after 30s)")
+    finally:
+        if echo:
+            sys.stdout.write("".join(echo))
+            sys.stdout.flush()
+        proc.stdout.close()
+    output = "".join(output_chunks).replace("\r\n", "\n").replace("\r", "\n")
+    return output.strip() or "(empty)"
 
 
 # --- Tool definitions: (description, schema, function) ---
@@ -163,8 +362,8 @@ TOOLS = {
         edit,
     ),
     "glob": (
-        "Find files by pattern, sorted by mtime",
-        {"pat": "string", "path": "string?"},
+        "Find files by pattern, newest first by mtime (default limit 200)",
+        {"pat": "string", "path": "string?", "limit": "number?"},
         glob,
     ),
     "grep": (
@@ -187,6 +386,14 @@ def run_tool(name, args):
         return f"error: {err}"
 
 
+# Gemini requires uppercase type names; Anthropic takes JSON Schema names
+_TYPE_MAP = (
+    {"string": "STRING", "number": "NUMBER", "boolean": "BOOLEAN"}
+    if PROVIDER == "gemini"
+    else {"string": "string", "number": "integer", "boolean": "boolean"}
+)
+
+
 def make_schema():
     """Generate tool schema in provider-specific format."""
     result = []
@@ -195,17 +402,7 @@ def make_schema():
         required = []
         for param_name, param_type in params.items():
             is_optional = param_type.endswith("?")
-            base_type = param_type.rstrip("?")
-            prop_def = {"type": "integer" if base_type == "number" else base_type}
-            
-            # Gemini requires type in uppercase for some types
-            if PROVIDER == "gemini" and base_type == "string":
-                prop_def["type"] = "STRING"
-            elif PROVIDER == "gemini" and base_type == "number":
-                prop_def["type"] = "NUMBER"
-            elif PROVIDER == "gemini" and base_type == "boolean":
-                prop_def["type"] = "BOOLEAN"
-                
+            prop_def = {"type": _TYPE_MAP[param_type.rstrip("?")]}
             properties[param_name] = prop_def
             if not is_optional:
                 required.append(param_name)
@@ -235,6 +432,16 @@ def make_schema():
     return result
 
 
+# Tool schema never changes after import: build and encode it once
+_SCHEMA = make_schema()
+_TOOLS_JSON = json_dumps([{"functionDeclarations": _SCHEMA}] if PROVIDER == "gemini" else _SCHEMA)
+
+
+def encode_payload(payload):
+    """Serialize a request payload, splicing in the pre-encoded tools block."""
+    return json_dumps(payload)[:-1] + b', "tools": ' + _TOOLS_JSON + b"}"
+
+
 def convert_messages_to_gemini(messages, system_prompt):
     """Convert Anthropic message format to Gemini format."""
     contents = []
@@ -269,87 +476,225 @@ def convert_messages_to_gemini(messages, system_prompt):
     return contents
 
 
-def convert_gemini_response(gemini_response):
-    """Convert Gemini response format to Anthropic format."""
-    content_blocks = []
-    
-    if "candidates" not in gemini_response or not gemini_response["candidates"]:
-        return {"content": [{"type": "text", "text": "No response from Gemini."}]}
-    
-    candidate = gemini_response["candidates"][0]
-    if "content" not in candidate:
-        return {"content": [{"type": "text", "text": "Empty response from Gemini."}]}
-    
-    parts = candidate["content"].get("parts", [])
+def convert_gemini_stream(chunks):
+    """Convert streamed Gemini chunks to Anthropic content blocks, yielding each once complete."""
+    text, seen = [], False
+    for chunk in chunks:
+        for candidate in chunk.get("candidates", [])[:1]:
+            for part in candidate.get("content", {}).get("parts", []):
+                seen = True
+                if "text" in part:
+                    text.append(part["text"])
+                elif "functionCall" in part:
+                    if text:
+                        yield {"type": "text", "text": "".join(text)}
+                        text = []
+                    fc = part["functionCall"]
+                    yield {
+                        "type": "tool_use",
+                        "id": fc.get("name", "unknown") + "_call",
+                        "name": fc["name"],
+                        "input": fc.get("args", {})
+                    }
+    if text:
+        yield {"type": "text", "text": "".join(text)}
+    elif not seen:
+        yield {"type": "text", "text": "No response from Gemini."}
+
+
+def convert_anthropic_stream(events):
+    """Assemble Anthropic stream events into content blocks, yielding each once complete."""
+    blocks, partial_json = {}, {}
+    for event in events:
+        kind = event.get("type")
+        if kind == "content_block_start":
+            blocks[event["index"]] = dict(event["content_block"])
+        elif kind == "content_block_delta":
+            delta = event["delta"]
+            if delta["type"] == "text_delta":
+                blocks[event["index"]]["text"] += delta["text"]
+            elif delta["type"] == "input_json_delta":
+                partial_json.setdefault(event["index"], []).append(delta["partial_json"])
+        elif kind == "content_block_stop":
+            block = blocks.pop(event["index"])
+            if block["type"] == "tool_use":
+                block["input"] = json_loads("".join(partial_json.pop(event["index"], [])) or "{}")
+            yield block
+        elif kind == "error":
+            raise RuntimeError(event["error"].get("message", "stream error"))
+
+
+_API = urllib.parse.urlsplit(API_URL)
+_conn = None
+
+
+def _connect():
+    """Open the API connection, tunnelling through an https proxy when urllib would use one."""
+    proxy = urllib.request.getproxies().get("https")
+    if not proxy or urllib.request.proxy_bypass(_API.hostname):
+        return http.client.HTTPSConnection(_API.netloc)
+    proxy = urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    tunnel_headers = {}
+    if proxy.username:
+        creds = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        tunnel_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(creds.encode()).decode()
+    conn = http.client.HTTPSConnection(proxy.hostname, proxy.port or 80)
+    conn.set_tunnel(_API.hostname, _API.port or 443, tunnel_headers)
+    return conn
+
+
+def post(path, body, headers):
+    """POST over one keep-alive HTTPS connection, reconnecting once if it went stale."""
+    global _conn
+    for attempt in range(2):
+        if _conn is None:
+            _conn = _connect()
+        try:
+            _conn.request("POST", path, body, headers)
+            response = _conn.getresponse()
+            break
+        except (http.client.HTTPException, ConnectionError):
+            _conn.close()
+            _conn = None
+            if attempt:
+                raise
+    if response.status >= 400:
+        detail = response.read().decode("utf-8", "replace")
+        raise RuntimeError(f"HTTP Error {response.status}: {response.reason} {detail}".rstrip())
+    return response
+
+
+def iter_sse(response):
+    """Yield the decoded JSON of each server-sent event `data:` line as it arrives."""
+    global _conn
+    try:
+        for line in response:
+            if line.startswith(b"data:"):
+                data = line[5:].strip()
+                if data and data != b"[DONE]":
+                    yield json_loads(data)
+    except BaseException:
+        # a half-read response would desync the keep-alive connection
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        raise
+    finally:
+        response.close()
+
+
+# Provider is fixed at import: pre-build request path and headers once
+if PROVIDER == "gemini":
+    _REQUEST_PATH = f"{_API.path}?alt=sse&key={GEMINI_KEY}"
+    _HEADERS = {"Content-Type": "application/json"}
+else:
+    _REQUEST_PATH = _API.path
+    _HEADERS = {
+        "Content-Type": "application/json",
+        "anthropic-version": "2023-06-01",
+        **({"Authorization": f"Bearer {OPENROUTER_KEY}"} if OPENROUTER_KEY else {"x-api-key": ANTHROPIC_KEY}),
+    }
+
+
+def _call_gemini(messages, system_prompt):
+    """Stream the Gemini API, yielding content blocks as they complete."""
+    contents = convert_messages_to_gemini(messages, system_prompt)
     
-    for part in parts:
-        if "text" in part:
-            content_blocks.append({"type": "text", "text": part["text"]})
-        elif "functionCall" in part:
-            fc = part["functionCall"]
-            content_blocks.append({
-                "type": "tool_use",
-                "id": fc.get("name", "unknown") + "_call",
-                "name": fc["name"],
-                "input": fc.get("args", {})
-            })
+    payload = {
+        "contents": contents,
+        "systemInstruction": {"parts": [{"text": system_prompt}]}
+    }
     
-    return {"content": content_blocks}
+    response = post(_REQUEST_PATH, encode_payload(payload), _HEADERS)
+    return convert_gemini_stream(iter_sse(response))
 
 
-def call_api(messages, system_prompt):
-    """Call the appropriate API based on provider."""
-    if PROVIDER == "gemini":
-        # Gemini API format
-        contents = convert_messages_to_gemini(messages, system_prompt)
-        
-        payload = {
-            "contents": contents,
-            "tools": [{"functionDeclarations": make_schema()}],
-            "systemInstruction": {"parts": [{"text": system_prompt}]}
-        }
-        
-        url = f"{API_URL}?key={GEMINI_KEY}"
-        request = urllib.request.Request(
-            url,
-            data=json.dumps(payload).encode(),
-            headers={"Content-Type": "application/json"},
-        )
-        response = urllib.request.urlopen(request)
-        gemini_response = json.loads(response.read())
-        return convert_gemini_response(gemini_response)
-    else:
-        # Anthropic/OpenRouter API format
-        request = urllib.request.Request(
-            API_URL,
-            data=json.dumps(
-                {
-                    "model": MODEL,
-                    "max_tokens": 8192,
-                    "system": system_prompt,
-                    "messages": messages,
-                    "tools": make_schema(),
-                }
-            ).encode(),
-            headers={
-                "Content-Type": "application/json",
-                "anthropic-version": "2023-06-01",
-                **({"Authorization": f"Bearer {OPENROUTER_KEY}"} if OPENROUTER_KEY else {"x-api-key": ANTHROPIC_KEY}),
-            },
-        )
-        response = urllib.request.urlopen(request)
-        return json.loads(response.read())
+def _call_anthropic(messages, system_prompt):
+    """Stream the Anthropic/OpenRouter API, yielding content blocks as they complete."""
+    payload = {
+        "model": MODEL,
+        "max_tokens": 8192,
+        "system": system_prompt,
+        "messages": messages,
+        "stream": True,
+    }
+    response = post(_REQUEST_PATH, encode_payload(payload), _HEADERS)
+    return convert_anthropic_stream(iter_sse(response))
+
+
+call_api = _call_gemini if PROVIDER == "gemini" else _call_anthropic
+
+
+# History budget: past this, old tool results are blanked so per-turn payloads stay bounded
+MAX_HISTORY_CHARS = 200_000
+KEEP_RECENT_TURNS = 20  # a turn is a request message plus the assistant reply: two messages
+TRUNCATED = "[truncated]"
+
+
+def trim_history(messages):
+    """Truncate tool results older than the last KEEP_RECENT_TURNS turns until under budget."""
+    total = sum(len(str(msg["content"])) for msg in messages)
+    for msg in messages[:-2 * KEEP_RECENT_TURNS]:
+        if total <= MAX_HISTORY_CHARS:
+            break
+        if isinstance(msg["content"], list):
+            for item in msg["content"]:
+                # shorter results (e.g. "ok") would only grow if replaced
+                if item["type"] == "tool_result" and len(item["content"]) > len(TRUNCATED):
+                    total -= len(item["content"]) - len(TRUNCATED)
+                    item["content"] = TRUNCATED
+
+
+# Single worker: tool calls run in order, but overlap with the rest of the stream
+TOOL_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+
+def run_tool_block(block):
+    """Run one tool_use block, printing its header and a result preview."""
+    tool_name = block["name"]
+    tool_args = block["input"]
+    arg_preview = str(list(tool_args.values())[0])[:50]
+    print(TOOL_HEADER % (tool_name.capitalize(), arg_preview))
+
+    result = run_tool(tool_name, tool_args)
+    result_lines = result.split("\n")
+    preview = result_lines[0][:60]
+    if len(result_lines) > 1:
+        preview += f" ... +{len(result_lines) - 1} lines"
+    elif len(result_lines[0]) > 60:
+        preview += "..."
+    print(TOOL_PREVIEW % preview)
+    return result
+
+
+def settled_result(future):
+    """Result text of a finished tool future; cancelled or failed runs become tool errors."""
+    if future.cancelled():
+        return "error: not run, the turn was interrupted"
+    err = future.exception()
+    return f"error: {err}" if err else future.result()
+
+
+def _build_separator(*_signal_args):
+    """Rebuild the cached separator; runs at import and on SIGWINCH."""
+    global _SEPARATOR
+    _SEPARATOR = f"{DIM}{'─' * min(shutil.get_terminal_size().columns, 80)}{RESET}"
+
+
+_build_separator()
 
 
 def separator():
-    return f"{DIM}{'─' * min(os.get_terminal_size().columns, 80)}{RESET}"
+    return _SEPARATOR
 
 
 def render_markdown(text):
-    return re.sub(r"\*\*(.+?)\*\*", f"{BOLD}\\1{RESET}", text)
+    return _MD_BOLD.sub(BOLD_REPL, text)
 
 
 def main():
+    if hasattr(signal, "SIGWINCH"):  # POSIX only: refresh width on terminal resize
+        signal.signal(signal.SIGWINCH, _build_separator)
     system_info = get_system_info()
     provider_name = PROVIDER.capitalize()
     print(f"{BOLD}nanocode{RESET} | {DIM}{MODEL} ({provider_name}) | {os.getcwd()}{RESET}\n")
@@ -379,51 +724,58 @@ Provide OS-appropriate commands and file paths based on the system information a
 
             # agentic loop: keep calling API until no more tool calls
             while True:
-                response = call_api(messages, system_prompt)
-                content_blocks = response.get("content", [])
-                tool_results = []
-
-                for block in content_blocks:
-                    if block["type"] == "text":
-                        print(f"\n{CYAN}⏺{RESET} {render_markdown(block['text'])}")
-
-                    if block["type"] == "tool_use":
-                        tool_name = block["name"]
-                        tool_args = block["input"]
-                        arg_preview = str(list(tool_args.values())[0])[:50]
-                        print(
-                            f"\n{GREEN}⏺ {tool_name.capitalize()}{RESET}({DIM}{arg_preview}{RESET})"
-                        )
-
-                        result = run_tool(tool_name, tool_args)
-                        result_lines = result.split("\n")
-                        preview = result_lines[0][:60]
-                        if len(result_lines) > 1:
-                            preview += f" ... +{len(result_lines) - 1} lines"
-                        elif len(result_lines[0]) > 60:
-                            preview += "..."
-                        print(f"  {DIM}⎿  {preview}{RESET}")
-
-                        tool_results.append(
+                content_blocks = []
+                pending = []
+
+                try:
+                    for block in call_api(messages, system_prompt):
+                        content_blocks.append(block)
+                        if block["type"] == "text":
+                            print(TEXT_BLOCK % render_markdown(block["text"]))
+
+                        if block["type"] == "tool_use":
+                            # start the tool now; the model may still be generating
+                            pending.append((block["id"], TOOL_EXECUTOR.submit(run_tool_block, block)))
+
+                    tool_results = [
+                        {
+                            "type": "tool_result",
+                            "tool_use_id": tool_use_id,
+                            "content": future.result(),
+                        }
+                        for tool_use_id, future in pending
+                    ]
+                except BaseException:
+                    # stream failed or Ctrl-C: drop queued tools and let a running one finish before leaving the turn
+                    for _tool_use_id, future in pending:
+                        future.cancel()
+                    concurrent.futures.wait([future for _tool_use_id, future in pending])
+                    if pending:
+                        # record the calls that were issued so their side effects stay in history
+                        messages.append({"role": "assistant", "content": content_blocks})
+                        messages.append({"role": "user", "content": [
                             {
                                 "type": "tool_result",
-                                "tool_use_id": block["id"],
-                                "content": result,
+                                "tool_use_id": tool_use_id,
+                                "content": settled_result(future),
                             }
-                        )
+                            for tool_use_id, future in pending
+                        ]})
+                    raise
 
                 messages.append({"role": "assistant", "content": content_blocks})
 
                 if not tool_results:
                     break
                 messages.append({"role": "user", "content": tool_results})
+                trim_history(messages)
 
             print()
 
         except (KeyboardInterrupt, EOFError):
             break
         except Exception as err:
-            print(f"{RED}⏺ Error: {err}{RESET}")
+            print(ERROR_LINE % err)
 
 
 if __name__ == "__main__":